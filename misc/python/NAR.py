@@ -4,64 +4,159 @@ Drop-in compatible NAR.py for Clojure ONA native binary
 This is API-compatible with the C ONA NAR.py, so all existing Python code
 written for C ONA will work unchanged with the GraalVM native Clojure binary.
 
-Uses threading to avoid subprocess buffering issues.
+Reads the subprocess pipe directly (selector + os.read) to avoid
+subprocess buffering issues without a reader thread.
 """
 import os
+import re
 import sys
-import ast
 import signal
+import functools
+import selectors
 import subprocess
-import threading
-import queue
 import time
+from dataclasses import dataclass
 from pathlib import Path
 
+try:
+    import fcntl
+except ImportError:  # not available on Windows
+    fcntl = None
+
 # Find native binary
 CLOJURE_ONA_DIR = Path(__file__).parent.parent.parent.absolute()
 NATIVE_BINARY = CLOJURE_ONA_DIR / "ona"
+_NATIVE = str(NATIVE_BINARY.resolve()) if NATIVE_BINARY.exists() else None  # checked once, at import
+_CWD = str(CLOJURE_ONA_DIR)
+
+# Pipe capacity for NAR output, so bursts (*stats, derivations) don't block the binary
+PIPE_SIZE = 1 << 20
+F_SETPIPE_SZ = getattr(fcntl, "F_SETPIPE_SZ", 1031)
+
+# The shell answers the "0" command with exactly this line, independent of
+# volume, so it terminates the output of every preceding command.
+DONE_SENTINEL = "done with 0 additional inference steps."
+
+# Fault timeout (seconds) for a whole reply; the sentinel normally ends the
+# wait long before this. None waits forever.
+TIMEOUT = 30.0
+
+# Splits a task line into its fields in one left-to-right match: the sentence
+# runs up to the first field marker, the fields follow in C ONA print order
+# (reason lines print occurrenceTime after Truth, hence the trailing group)
+_TASK_RE = re.compile(
+    r"(?P<sentence>[^ ]*(?: (?!occurrenceTime=|Priority=|creationTime=|Stamp=|Truth)[^ ]*)*)"
+    r"(?: occurrenceTime=(?P<occurrenceTime>[^ ]*))?"
+    r"(?: Priority=(?P<Priority>[^ ]*))?"
+    r"(?: creationTime=[^ ]*)?"
+    r"(?: Stamp=\[(?P<Stamp>[^\]]*)\])?"
+    r"(?: Truth: (?P<truth>[^ ]* [^ ]*))?"
+    r"(?:.*? occurrenceTime=(?P<lateOccurrenceTime>[^ ]*))?",
+    re.DOTALL)
+
+# First character of a task output line -> (line prefix, GetOutput result key)
+_TASK_PREFIXES = {"I": ("Input:", "input"), "D": ("Derived:", "derivations"), "R": ("Revised:", "derivations"),
+                  "A": ("Answer:", "answers"), "S": ("Selected:", "selections")}
+
+# "key: value" lines of a *stats reply, skipping // comments
+_STATS_RE = re.compile(r"^(?!//)([^:\n]*):[ \t]*(.*?)[ \t]*$", re.MULTILINE)
+# An input line asking for 0 cycles ("0", "00", ...); the shell answers it with DONE_SENTINEL
+_ZERO_CYCLES_RE = re.compile(r"^[ \t\r]*0+[ \t\r]*$", re.MULTILINE)
+_NUMBER_RE = re.compile(r"-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?")
+
+def _exitedError(usedNAR):
+    """Reap a NAR whose output has ended and describe it as an error"""
+    usedNAR.wait()
+    return EOFError(f"NAR exited with code {usedNAR.returncode} before finishing its reply")
 
 def spawnNAR():
-    """Spawn ONA native binary subprocess with threaded output reading"""
-    if not NATIVE_BINARY.exists():
+    """Spawn ONA native binary subprocess with selector-driven output reading"""
+    if _NATIVE is None:
         raise FileNotFoundError(
             f"Native binary not found: {NATIVE_BINARY}\n"
-            "Run: ./scripts/build_native.sh from {CLOJURE_ONA_DIR}"
+            f"Run: ./scripts/build_native.sh from {CLOJURE_ONA_DIR}"
         )
 
     proc = subprocess.Popen(
-        [str(NATIVE_BINARY), "shell"],
+        [_NATIVE, "shell"],
         stdin=subprocess.PIPE,
         stdout=subprocess.PIPE,
         stderr=subprocess.STDOUT,
-        universal_newlines=True,
-        bufsize=1,
-        cwd=str(CLOJURE_ONA_DIR)
+        bufsize=0,  # binary, unbuffered: each write is one os.write, no text codec
+        cwd=_CWD,
+        start_new_session=True  # own process group, so terminateNAR can signal it as a whole
     )
 
-    # Create output queue and reader thread
-    proc.output_queue = queue.Queue()
-
-    def read_output():
+    if fcntl is not None:
         try:
-            for line in iter(proc.stdout.readline, ''):
-                if line:
-                    proc.output_queue.put(line.rstrip())
-        except:
+            fcntl.fcntl(proc.stdout.fileno(), F_SETPIPE_SZ, PIPE_SIZE)
+        except OSError:  # not Linux, or above /proc/sys/fs/pipe-max-size
             pass
 
-    proc.reader_thread = threading.Thread(target=read_output, daemon=True)
-    proc.reader_thread.start()
+    # Output is read straight from the (non-blocking) pipe fd; partial lines stay buffered
+    os.set_blocking(proc.stdout.fileno(), False)
+    proc.selector = selectors.DefaultSelector()
+    proc.selector.register(proc.stdout, selectors.EVENT_READ)
+    proc.output_buffer = bytearray()
+    proc.output_eof = False  # set by readLines once stdout is closed
 
-    # Consume welcome message
-    time.sleep(0.05)
-    while True:
-        try:
-            proc.output_queue.get(timeout=0.05)
-        except queue.Empty:
+    # Consume welcome message: it ends where the reply to a "0" probe arrives
+    try:
+        proc.stdin.write(b"0\n")
+    except BrokenPipeError:
+        raise _exitedError(proc) from None
+    for line in readLines(proc, TIMEOUT):
+        if line == DONE_SENTINEL:
             break
+    else:
+        if proc.output_eof:
+            raise _exitedError(proc)
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        proc.wait()
+        raise TimeoutError(f"NAR did not answer the startup probe within {TIMEOUT} s")
 
     return proc
 
+def readLines(usedNAR, timeout=None):
+    """Yield output lines as they arrive; stops on EOF or once timeout seconds have passed
+
+    Which of the two ended it is recorded in usedNAR.output_eof.
+    """
+    fd = usedNAR.stdout.fileno()
+    buf = usedNAR.output_buffer
+    find, select, read, monotonic = buf.find, usedNAR.selector.select, os.read, time.monotonic  # hoisted out of the loop
+    deadline = None if timeout is None else monotonic() + timeout
+    while True:
+        nl = find(b"\n")
+        if nl >= 0:
+            end = nl - 1 if nl and buf[nl - 1] == 13 else nl  # drop the \r of \r\n
+            line = buf[:end].decode(errors="replace")
+            del buf[:nl + 1]
+            yield line
+            continue
+        if deadline is not None:
+            timeout = deadline - monotonic()
+            if timeout <= 0:
+                return
+        if not select(timeout):
+            return
+        received = False
+        while True:  # take everything the pipe holds before splitting lines
+            try:
+                data = read(fd, 65536)
+            except BlockingIOError:
+                break
+            if not data:  # EOF: stop once the buffered lines are handed out
+                if not received:
+                    usedNAR.output_eof = True
+                    return
+                break
+            buf += data
+            received = True
+
 NARproc = spawnNAR()
 
 def getNAR():
@@ -72,130 +167,217 @@ def setNAR(proc):
     NARproc = proc
 
 def terminateNAR(usedNAR=None):
+    """Stop the NAR within ~0.2 s: ask it to quit and SIGTERM its group at once, SIGKILL as a last resort"""
     if usedNAR is None:
         usedNAR = NARproc
+    if usedNAR.poll() is not None:  # already gone; its pid may be reused
+        return
     try:
-        usedNAR.stdin.write("quit\n")
-        usedNAR.stdin.flush()
-        usedNAR.wait(timeout=1)
-    except:
-        usedNAR.terminate()
+        usedNAR.stdin.write(b"quit\n")
+    except OSError:
+        pass
+    try:
+        os.killpg(usedNAR.pid, signal.SIGTERM)  # new session: pgid == pid
+    except ProcessLookupError:
+        pass
+    try:
+        usedNAR.wait(timeout=0.2)
+    except subprocess.TimeoutExpired:
+        usedNAR.kill()
+        usedNAR.wait()
+
+@dataclass(frozen=True, slots=True)
+class Task:
+    """Compact parsed task; parseTask exposes it as a C ONA style dict"""
+    term: str
+    punctuation: str
+    occurrenceTime: str = "eternal"
+    truth: tuple | None = None  # (frequency, confidence)
+    priority: str | None = None
+    stamp: tuple | None = None
+
+    def as_dict(self):
+        M = {"occurrenceTime" : self.occurrenceTime}
+        if self.stamp is not None:
+            M["Stamp"] = list(self.stamp)
+        M["punctuation"] = self.punctuation
+        M["term"] = self.term
+        if self.truth is not None:
+            M["truth"] = {"frequency": self.truth[0], "confidence": self.truth[1]}
+        if self.priority is not None:
+            M["Priority"] = self.priority
+        return M
+
+@functools.lru_cache(maxsize=4096)
+def _parseTruth(T):
+    frequency = T.partition("frequency=")[2].partition(" confidence")[0].replace(",","")
+    confidence = T.partition(" confidence=")[2].partition(" dt=")[0].partition(" occurrenceTime=")[0]
+    return frequency, confidence
 
 def parseTruth(T):
-    return {"frequency": T.split("frequency=")[1].split(" confidence")[0].replace(",",""), "confidence": T.split(" confidence=")[1].split(" dt=")[0].split(" occurrenceTime=")[0]}
+    """Parse a truth value; memoized as a tuple, callers get a fresh dict"""
+    frequency, confidence = _parseTruth(T)
+    return {"frequency": frequency, "confidence": confidence}
 
-def parseTask(s):
-    M = {"occurrenceTime" : "eternal"}
+@functools.lru_cache(maxsize=4096)
+def _parseTask(s):
+    occurrenceTime = "eternal"
     if " :|:" in s:
-        M["occurrenceTime"] = "now"
+        occurrenceTime = "now"
         s = s.replace(" :|:","")
-        if "occurrenceTime" in s:
-            M["occurrenceTime"] = s.split("occurrenceTime=")[1].split(" ")[0]
-    if "Stamp" in s:
-        M["Stamp"] = ast.literal_eval(s.split("Stamp=")[1].split("]")[0]+"]")
-    sentence = s.split(" occurrenceTime=")[0] if " occurrenceTime=" in s else s.split(" Stamp=")[0].split(" Priority=")[0].split(" creationTime=")[0]
-    M["punctuation"] = sentence[-4] if ":|:" in sentence else sentence[-1]
-    M["term"] = sentence.split(" creationTime")[0].split(" occurrenceTime")[0].split(" Truth")[0].split(" Stamp=")[0][:-1]
-    if "Truth" in s:
-        M["truth"] = parseTruth(s.split("Truth: ")[1])
-    if "Priority" in s:
-        M["Priority"] = s.split("Priority=")[1].split(" ")[0]
-    return M
-
-def parseReason(sraw):
-    if "implication: " not in sraw:
+    m = _TASK_RE.match(s)
+    if occurrenceTime == "now":
+        occurrenceTime = m["occurrenceTime"] or m["lateOccurrenceTime"] or "now"
+    sentence = m["sentence"]
+    return Task(term=sentence[:-1],
+                punctuation=sentence[-1],
+                occurrenceTime=occurrenceTime,
+                truth=_parseTruth(m["truth"]) if m["truth"] is not None else None,
+                priority=m["Priority"],
+                stamp=tuple([int(x) for x in m["Stamp"].split(",") if x]) if m["Stamp"] is not None else None)
+
+def parseTask(s):
+    """Parse a task line; the memoized Task is immutable, callers get a fresh dict"""
+    return _parseTask(s).as_dict()
+
+def parseReason(lines):
+    if isinstance(lines, str):
+        lines = lines.split("\n")
+    for sraw in reversed(lines): #last reason only (others couldn't be associated currently)
+        if "implication: " in sraw:
+            break
+    else:
         return None
-    Implication = parseTask(sraw.split("implication: ")[-1].split("precondition: ")[0]) #last reason only (others couldn't be associated currently)
-    Precondition = parseTask(sraw.split("precondition: ")[-1].split("\n")[0])
+    Implication = parseTask(sraw.rpartition("implication: ")[2].partition("precondition: ")[0])
+    Precondition = parseTask(sraw.rpartition("precondition: ")[2])
     Implication["occurrenceTime"] = "eternal"
     Precondition["punctuation"] = Implication["punctuation"] = "."
     Reason = {}
-    Reason["desire"] = sraw.split("decision expectation=")[-1].split(" ")[0]
+    Reason["desire"] = sraw.rpartition("decision expectation=")[2].partition(" ")[0]
     Reason["hypothesis"] = Implication
     Reason["precondition"] = Precondition
     return Reason
 
 def parseExecution(e):
-    if "args " not in e:
-        return {"operator" : e.split(" ")[0], "arguments" : []}
-    opname = e.split(" ")[0]
-    return {"operator": opname, "arguments": e.split("args ")[1].split("{SELF} * ")[1][:-1], 'metta': '(^ ' + opname[1:] + ')'}
+    opname, _, rest = e.partition(" ")
+    if "args " not in rest:
+        return {"operator" : opname, "arguments" : []}
+    return {"operator": opname, "arguments": rest.partition("args ")[2].partition("{SELF} * ")[2][:-1], 'metta': '(^ ' + opname[1:] + ')'}
+
+def GetRawOutput(usedNAR, prefix=""):
+    """Send prefix plus the "0" sentinel command in one write, then block until its reply
 
-def GetRawOutput(usedNAR):
-    """Get raw output from NAR using threaded queue reading"""
-    usedNAR.stdin.write("0\n")
-    usedNAR.stdin.flush()
+    Raises EOFError if the NAR exits first, TimeoutError if TIMEOUT passes first.
+    """
+    try:
+        usedNAR.stdin.write((prefix + "0\n").encode())
+    except BrokenPipeError:
+        raise _exitedError(usedNAR) from None
 
     lines = []
+    append = lines.append
     requestOutputArgs = False
-    deadline = time.time() + 0.5
+    # Sentinels answering zero cycle counts inside prefix come before our own
+    early = len(_ZERO_CYCLES_RE.findall(prefix))
 
-    while time.time() < deadline:
-        try:
-            line = usedNAR.output_queue.get(timeout=0.05)
-            if line == "done with 0 additional inference steps.":
-                break
-            lines.append(line)
-            if line == "//Operation result product expected:":
-                requestOutputArgs = True
-                break
-            if line == "//*done":
-                break
-        except queue.Empty:
-            if lines:  # Got some output, done
-                break
+    for line in readLines(usedNAR, TIMEOUT):
+        if line == DONE_SENTINEL:
+            if early:
+                early -= 1
+                continue
+            break
+        append(line)
+        if line == "//Operation result product expected:":
+            requestOutputArgs = True
+            break
+    else:
+        if usedNAR.output_eof:
+            raise _exitedError(usedNAR)
+        raise TimeoutError(f"NAR did not finish its reply within {TIMEOUT} s")
 
     return lines, requestOutputArgs
 
-def GetOutput(usedNAR):
-    lines, requestOutputArgs = GetRawOutput(usedNAR)
-    executions = [parseExecution(l) for l in lines if l.startswith('^')]
-    inputs = [parseTask(l.split("Input: ")[1]) for l in lines if l.startswith('Input:')]
-    derivations = [parseTask(l.split("Derived: " if l.startswith('Derived:') else "Revised: ")[1]) for l in lines if l.startswith('Derived:') or l.startswith('Revised:')]
-    answers = [parseTask(l.split("Answer: ")[1]) for l in lines if l.startswith('Answer:')]
-    selections = [parseTask(l.split("Selected: ")[1]) for l in lines if l.startswith('Selected:')]
-    reason = parseReason("\n".join(lines))
-    return {"input": inputs, "derivations": derivations, "answers": answers, "executions": executions, "reason": reason, "selections": selections, "raw": "\n".join(lines), "requestOutputArgs" : requestOutputArgs}
-
-def GetStats(usedNAR):
-    Stats = {}
-    lines, _ = GetRawOutput(usedNAR)
+def GetOutput(usedNAR, prefix=""):
+    lines, requestOutputArgs = GetRawOutput(usedNAR, prefix)
+    executions = []
+    tasks = {"input": [], "derivations": [], "answers": [], "selections": []}
+    addExecution, lookup = executions.append, _TASK_PREFIXES.get
     for l in lines:
-        if ":" in l and not l.startswith("//"):
-            parts = l.split(":", 1)
-            if len(parts) == 2:
-                leftside = parts[0].replace(" ", "_").strip()
-                rightside_str = parts[1].strip()
-                try:
-                    Stats[leftside] = float(rightside_str)
-                except ValueError:
-                    Stats[leftside] = rightside_str
+        first = l[:1]
+        if first == '^':
+            addExecution(parseExecution(l))
+            continue
+        entry = lookup(first)
+        if entry is not None and l.startswith(entry[0]):
+            tasks[entry[1]].append(parseTask(l[len(entry[0]):].lstrip()))
+    reason = parseReason(lines)
+    return {"input": tasks["input"], "derivations": tasks["derivations"], "answers": tasks["answers"], "executions": executions, "reason": reason, "selections": tasks["selections"], "raw": "\n".join(lines), "requestOutputArgs" : requestOutputArgs}
+
+def GetStats(usedNAR, prefix=""):
+    lines, _ = GetRawOutput(usedNAR, prefix)
+    return parseStats(lines)
+
+def parseStats(lines):
+    Stats = {}
+    for key, value in _STATS_RE.findall("\n".join(lines)):
+        Stats[key.replace(" ", "_").strip()] = float(value) if _NUMBER_RE.fullmatch(value) else value
     return Stats
 
 def AddInput(narsese, Print=True, usedNAR=None):
     if usedNAR is None:
         usedNAR = NARproc
-    usedNAR.stdin.write(narsese + '\n')
-    usedNAR.stdin.flush()
     ReturnStats = narsese == "*stats"
     if ReturnStats:
-        result = GetStats(usedNAR)
+        lines, _ = GetRawOutput(usedNAR, narsese + '\n')
         if Print:
-            lines, _ = GetRawOutput(usedNAR)
             print("\n".join(lines))
-        return result
-    ret = GetOutput(usedNAR)
+        return parseStats(lines)
+    ret = GetOutput(usedNAR, narsese + '\n')
+    if Print:
+        print(ret["raw"])
+        sys.stdout.flush()
+    return ret
+
+def AddInputs(narseseList, Print=True, usedNAR=None):
+    """Send several inputs in one write and parse their combined output once
+
+    The write blocks and nothing drains stdout until it completes: a batch
+    whose input overflows the stdin pipe while its output fills the stdout
+    pipe deadlocks, so keep batches moderate (a few hundred lines is safe).
+    """
+    if usedNAR is None:
+        usedNAR = NARproc
+    ret = GetOutput(usedNAR, "".join(narsese + '\n' for narsese in narseseList))
     if Print:
         print(ret["raw"])
         sys.stdout.flush()
     return ret
 
+def AddInputNoWait(narsese, usedNAR=None):
+    """Send input without waiting for its reply; its output is folded into the
+    next reply read (call GetRawOutput to wait for it explicitly)
+
+    Nothing drains stdout until that read, and the write blocks without a
+    timeout: after too many unanswered inputs the NAR stalls on a full
+    stdout pipe, stops reading stdin, and this call blocks forever.
+    A zero cycle count ("0", "00", ...) is rejected with ValueError: its
+    reply is the sentinel, which the next read would take for its own,
+    putting every later reply out of step.
+    """
+    if _ZERO_CYCLES_RE.search(narsese):
+        raise ValueError(f"input produces the reply sentinel: {narsese!r}")
+    if usedNAR is None:
+        usedNAR = NARproc
+    try:
+        usedNAR.stdin.write((narsese + '\n').encode())
+    except BrokenPipeError:
+        raise _exitedError(usedNAR) from None
+
 def Exit(usedNAR=None):
     if usedNAR is None:
         usedNAR = NARproc
     try:
-        usedNAR.stdin.write("quit\n")
-        usedNAR.stdin.flush()
+        usedNAR.stdin.write(b"quit\n")
     except:
         pass
 
@@ -203,6 +385,8 @@ def Reset(usedNAR=None):
     if usedNAR is None:
         usedNAR = NARproc
     AddInput("*reset", usedNAR=usedNAR)
+    _parseTask.cache_clear()
+    _parseTruth.cache_clear()
 
 # Set default volume
 AddInput("*volume=100")
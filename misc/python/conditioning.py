@@ -46,9 +46,7 @@ for b in range(10):
         right = trial[2]
         expected_op = trial[3]
 
-        NAR.AddInput(sample, Print=False)
-        NAR.AddInput(left, Print=False)
-        NAR.AddInput(right, Print=False)
+        NAR.AddInputs([sample, left, right], Print=False)
 
         response = NAR.AddInput("G! :|:", Print=False)
         executions = response["executions"]
@@ -96,9 +94,7 @@ for b in range(20):
         right = trial[2]
         expected_op = trial[3]
 
-        NAR.AddInput(sample, Print=False)
-        NAR.AddInput(left, Print=False)
-        NAR.AddInput(right, Print=False)
+        NAR.AddInputs([sample, left, right], Print=False)
 
         response = NAR.AddInput("G! :|:", Print=loud)
         executions = response["executions"]
@@ -180,9 +176,7 @@ for b in range(4):
         right = trial[2]
         expected_op = trial[3]
 
-        NAR.AddInput(sample, Print=False)
-        NAR.AddInput(left, Print=False)
-        NAR.AddInput(right, Print=False)
+        NAR.AddInputs([sample, left, right], Print=False)
 
         response = NAR.AddInput("G! :|:", Print=False)
         if response["executions"]:
@@ -15,7 +15,7 @@ The ball moves left/right, and NAR learns to move the paddle to intercept it.
 import sys
 import time
 import random
-from NAR import AddInput, Reset, Exit
+from NAR import AddInput, AddInputs, AddInputNoWait, Reset, Exit
 
 class PongGame:
     """Simple pong game state"""
@@ -136,8 +136,7 @@ def run_game(num_steps=50, enable_babbling=True, verbose=True):
         states = game.get_state()
 
         # Send sensory observations to NAR
-        for state in states:
-            AddInput(f"{state}. :|:", Print=False)
+        AddInputs([f"{state}. :|:" for state in states], Print=False)
 
         # Give goal: want to hit ball
         result = AddInput("hit! :|:", Print=False)
@@ -157,9 +156,13 @@ def run_game(num_steps=50, enable_babbling=True, verbose=True):
 
         # Check if hit
         hit = game.check_hit()
+
+        # Let NAR process: 3 inference steps, after the positive feedback on a hit,
+        # in one write. Nothing reads this reply; it arrives with the next step's
+        # observations.
+        AddInputNoWait("hit. :|:\n3" if hit else "3")
+
         if hit:
-            # Positive feedback
-            AddInput("hit. :|:", Print=False)
             if verbose:
                 print("✓ HIT!")
         else:
@@ -173,9 +176,6 @@ def run_game(num_steps=50, enable_babbling=True, verbose=True):
         if verbose or step % 5 == 0:
             game.print_state()
 
-        # Let NAR process
-        AddInput("3", Print=False)  # 3 inference steps
-
         # Small delay for visibility
         if verbose:
             time.sleep(0.1)
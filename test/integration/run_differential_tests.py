@@ -8,11 +8,29 @@ Runs the same NAL tests on both implementations and compares:
 - Query answers
 - Concept formation
 """
+import argparse
+import os
 import subprocess
 import sys
 import re
+import tempfile
 from pathlib import Path
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+# Output is parsed as raw bytes; only the extracted fields are decoded
+_TERM_RE = re.compile(rb'"term":\s*"([^"]+)"')
+_ARROW = b'=/>'
+_ANSWER = b'Answer:'
+_EXECUTED = b'^executed:'
+_EXECUTED_WITH_ARGS = b'executed with args'
+_CONCEPTS_START = b'//*concepts'
+_CONCEPTS_END = b'//*done'
+_IMPLICATIONS = b'"implications":'
+# Output containing these marks the run as failed (e.g. "ERROR parsing Narsese:")
+_FAILURE_MARKERS = (b'ERROR', b'TIMEOUT')
+# *concepts commands in a test payload, dropped unless --full is given
+_CONCEPTS_CMD_RE = re.compile(rb'^\*concepts[ \t]*\r?(?:\n|$)', re.MULTILINE)
 
 class TestComparison:
     def __init__(self, test_name):
@@ -31,89 +49,108 @@ class TestComparison:
     def matches(self):
         return len(self.differences) == 0
 
-def run_ona_test(test_file, binary):
-    """Run a NAL test and capture output"""
+def run_ona_test(payload, binary):
+    """Run a NAL test and return its output as a temporary file
+
+    payload is the content of the .nal file as bytes. stdout is handed to
+    the child as a file descriptor, so the output (including large
+    *concepts dumps) goes straight to disk instead of being buffered in
+    memory. On failure an error string is returned.
+    """
+    output = tempfile.TemporaryFile()
     try:
-        result = subprocess.run(
+        subprocess.run(
             [binary, "shell"],
-            input=open(test_file).read(),
-            capture_output=True,
-            text=True,
+            input=payload,
+            stdout=output,
+            stderr=subprocess.DEVNULL,
             timeout=30
         )
-        return result.stdout
+        return output
     except subprocess.TimeoutExpired:
+        output.close()
         return "TIMEOUT"
     except Exception as e:
+        output.close()
         return f"ERROR: {e}"
 
-def parse_executions(output):
-    """Extract executed operations from output
+def parse_all(output):
+    """Extract executions, implications and answers from an output file
 
-    Both C ONA and Clojure ONA output execution lines, but in different formats:
+    The file is walked once and each line is dispatched to whichever of the
+    three extractors it belongs to.
+
+    Executions: both C ONA and Clojure ONA output execution lines, but in
+    different formats:
     - C ONA: "^left executed with args"
     - Clojure ONA: BOTH "^left executed with args" AND "^executed: ^left desire=0.71"
 
     We prefer the "^executed:" format as it's more informative and canonical.
     If output contains "^executed:" lines, use only those.
     Otherwise, use "executed with args" lines (for C ONA compatibility).
+
+    Implications are taken from the *concepts output, answers from
+    "Answer:" lines. Lines containing ERROR or TIMEOUT are returned as
+    errors, which fail the run.
     """
     executions = []
     executed_format_lines = []
-
-    # First pass: collect all "^executed:" format lines
-    for line in output.split('\n'):
-        if line.startswith('^executed:'):
-            parts = line.split()
-            if len(parts) >= 2:
-                executed_format_lines.append(parts[1])
-
-    # If we found ^executed: format lines, use those (Clojure ONA)
-    if executed_format_lines:
-        return executed_format_lines
-
-    # Otherwise, parse "executed with args" format (C ONA)
-    for line in output.split('\n'):
-        if 'executed with args' in line:
-            parts = line.split()
-            if len(parts) >= 1 and parts[0].startswith('^'):
-                executions.append(parts[0])
-
-    return executions
-
-def parse_implications(output):
-    """Extract learned implications from *concepts output"""
     implications = []
+    answers = []
+    errors = []
     in_concepts = False
 
-    for line in output.split('\n'):
-        if '//*concepts' in line:
+    output.seek(0)
+    for line in output:
+        if any(marker in line for marker in _FAILURE_MARKERS):
+            errors.append(line.strip().decode(errors='replace'))
+
+        if _CONCEPTS_START in line:
             in_concepts = True
             continue
-        if '//*done' in line:
+        if _CONCEPTS_END in line:
             in_concepts = False
             continue
 
-        if in_concepts and '"implications":' in line:
-            # Extract implication terms from JSON-like output
-            # Look for: "term": "<something =/> something>"
-            matches = re.findall(r'"term":\s*"([^"]+)"', line)
-            for match in matches:
-                if '=/>' in match:
-                    implications.append(match)
+        if in_concepts:
+            if _IMPLICATIONS in line:
+                # Extract implication terms from JSON-like output
+                # Look for: "term": "<something =/> something>"
+                for match in _TERM_RE.findall(line):
+                    if _ARROW in match:
+                        implications.append(match.decode())
+        elif line.startswith(_EXECUTED):
+            parts = line.split()
+            if len(parts) >= 2:
+                executed_format_lines.append(parts[1].decode())
+        elif line.startswith(_ANSWER):
+            # Match: Answer: <A =/> B>. Truth: frequency=1.0 confidence=0.42
+            answer = line.replace(_ANSWER, b'').strip()
+            answers.append(answer.decode())
+        elif _EXECUTED_WITH_ARGS in line:
+            parts = line.split()
+            if len(parts) >= 1 and parts[0].startswith(b'^'):
+                executions.append(parts[0].decode())
+
+    # If we found ^executed: format lines, use those (Clojure ONA)
+    if executed_format_lines:
+        executions = executed_format_lines
+
+    return executions, implications, answers, errors
 
-    return implications
+def parse_run(output):
+    """Parse a run_ona_test result into (failure, (executions, implications, answers))
 
-def parse_answers(output):
-    """Extract query answers from output"""
-    answers = []
-    for line in output.split('\n'):
-        # Match: Answer: <A =/> B>. Truth: frequency=1.0 confidence=0.42
-        if line.startswith('Answer:'):
-            # Extract the answer term and truth
-            answer = line.replace('Answer:', '').strip()
-            answers.append(answer)
-    return answers
+    failure is None for a clean run; otherwise it describes why the run
+    failed and the parsed fields are None.
+    """
+    if isinstance(output, str):
+        return output, None
+    with output:
+        executions, implications, answers, errors = parse_all(output)
+    if errors:
+        return "\n".join(errors), None
+    return None, (executions, implications, answers)
 
 def compare_executions(c_execs, clojure_execs):
     """Compare executed operations between implementations"""
@@ -166,8 +203,11 @@ def compare_implications(c_impls, clojure_impls):
 
     return differences
 
-def run_differential_test(test_file, c_binary, clojure_binary):
-    """Run differential test and return comparison"""
+def run_differential_test(test_file, c_run, clojure_run):
+    """Compare the runs of a test on both implementations
+
+    c_run and clojure_run are futures of run_ona_test for this test file.
+    """
     test_name = Path(test_file).name
 
     print(f"\n{'='*70}")
@@ -178,29 +218,27 @@ def run_differential_test(test_file, c_binary, clojure_binary):
 
     # Run on C ONA
     print("Running on C ONA...", end=' ', flush=True)
-    c_output = run_ona_test(test_file, c_binary)
-    if "TIMEOUT" in c_output or "ERROR" in c_output:
-        print(f"❌ {c_output}")
-        comparison.add_difference("C ONA", c_output)
+    c_failure, c_parsed = parse_run(c_run.result())
+    if c_failure:
+        print(f"❌ {c_failure}")
+        parse_run(clojure_run.result())  # closes its output file
+        comparison.add_difference("C ONA", c_failure)
         return comparison
     print("✓")
 
     # Run on Clojure ONA
     print("Running on Clojure ONA...", end=' ', flush=True)
-    clojure_output = run_ona_test(test_file, clojure_binary)
-    if "TIMEOUT" in clojure_output or "ERROR" in clojure_output:
-        print(f"❌ {clojure_output}")
-        comparison.add_difference("Clojure ONA", clojure_output)
+    clojure_failure, clojure_parsed = parse_run(clojure_run.result())
+    if clojure_failure:
+        print(f"❌ {clojure_failure}")
+        comparison.add_difference("Clojure ONA", clojure_failure)
         return comparison
     print("✓")
 
-    # Parse outputs
-    comparison.c_executions = parse_executions(c_output)
-    comparison.clojure_executions = parse_executions(clojure_output)
-    comparison.c_implications = parse_implications(c_output)
-    comparison.clojure_implications = parse_implications(clojure_output)
-    comparison.c_answers = parse_answers(c_output)
-    comparison.clojure_answers = parse_answers(clojure_output)
+    (comparison.c_executions, comparison.c_implications,
+     comparison.c_answers) = c_parsed
+    (comparison.clojure_executions, comparison.clojure_implications,
+     comparison.clojure_answers) = clojure_parsed
 
     print(f"  C ONA executions: {comparison.c_executions}")
     print(f"  Clojure executions: {comparison.clojure_executions}")
@@ -226,6 +264,11 @@ def run_differential_test(test_file, c_binary, clojure_binary):
     return comparison
 
 def main():
+    parser = argparse.ArgumentParser(description="Compare C ONA and Clojure ONA on the integration tests")
+    parser.add_argument("--full", action="store_true",
+                        help="also dump *concepts and compare learned implications")
+    args = parser.parse_args()
+
     # Find binaries
     script_dir = Path(__file__).parent
     clojure_binary = script_dir.parent.parent / "ona"
@@ -253,11 +296,26 @@ def main():
 
     print(f"Found {len(test_files)} test file(s)")
 
-    # Run all differential tests
+    # Read each test once; both implementations get the same bytes.
+    # Without --full only executions gate the result, so the concept dump
+    # (the largest part of the output) is not requested at all.
+    test_payloads = {test_file: test_file.read_bytes() for test_file in test_files}
+    if not args.full:
+        test_payloads = {test_file: _CONCEPTS_CMD_RE.sub(b'', payload)
+                         for test_file, payload in test_payloads.items()}
+
+    # Run all differential tests. The runs are independent processes, so
+    # they all go to a thread pool at once; results are compared in test
+    # order as they complete.
     results = []
-    for test_file in test_files:
-        result = run_differential_test(test_file, c_binary, clojure_binary)
-        results.append(result)
+    with ThreadPoolExecutor(max_workers=os.cpu_count()) as pool:
+        runs = [(test_file,
+                 pool.submit(run_ona_test, test_payloads[test_file], c_binary),
+                 pool.submit(run_ona_test, test_payloads[test_file], clojure_binary))
+                for test_file in test_files]
+        for test_file, c_run, clojure_run in runs:
+            result = run_differential_test(test_file, c_run, clojure_run)
+            results.append(result)
 
     # Print summary
     print(f"\n{'='*70}")
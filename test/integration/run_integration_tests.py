@@ -7,51 +7,64 @@ Runs NAL test files and validates execution success.
 import subprocess
 import sys
 import os
+import io
+import re
+import signal
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from pathlib import Path
 
 # Add parent misc/python to path
 sys.path.insert(0, str(Path(__file__).parent.parent.parent / "misc" / "python"))
 
+# Compiled once at import and shared by every test file
+_CRITERIA_RE = re.compile(rb'^.*Success Criteria:.*$', re.MULTILINE)
+_SETOPNAME_RE = re.compile(rb'^[ \t]*\*setopname[ \t]+\S+[ \t]+(\S+)', re.MULTILINE)
+_GOAL_RE = re.compile(rb'^.*(?:!.*:\|:|:\|:.*!)', re.MULTILINE)
+_EXEC_RE = re.compile(rb'\^executed:[ \t]+(\S+)')
+
+@dataclass(slots=True)
 class TestResult:
-    def __init__(self, name, expected_ops, found_ops, success_rate):
-        self.name = name
-        self.expected_ops = expected_ops
-        self.found_ops = found_ops
-        self.success_rate = success_rate
-        self.passed = success_rate >= expected_ops["threshold"]
-
-def parse_nal_expectations(nal_file):
-    """Parse NAL file to extract expected operations and success threshold"""
-    with open(nal_file) as f:
-        content = f.read()
-
-    # Extract from comments
+    name: str
+    expected_ops: dict
+    found_ops: list
+    success_rate: float
+    # Executions of registered operations; found_ops keeps every execution
+    hits: int = 0
+    passed: bool = field(init=False)
+
+    def __post_init__(self):
+        self.passed = self.success_rate >= self.expected_ops["threshold"]
+
+def parse_nal_expectations(content):
+    """Parse NAL file content to extract expected operations and success threshold
+
+    content is the raw file as bytes. Each expectation is found by a
+    precompiled pattern scanning the whole content, rather than by
+    Python-level checks on every line; only operation names are decoded.
+    """
+    # Extract threshold from the first "Success Criteria:" comment
     threshold = 0.8  # default
-    if "Success Criteria:" in content:
-        line = [l for l in content.split('\n') if "Success Criteria:" in l][0]
-        if "80%" in line:
+    criteria = _CRITERIA_RE.search(content)
+    if criteria:
+        line = criteria.group()
+        if b"80%" in line:
             threshold = 0.8
-        elif "70%" in line:
+        elif b"70%" in line:
             threshold = 0.7
-        elif "60%" in line:
+        elif b"60%" in line:
             threshold = 0.6
 
-    # Count setopname commands to know which operations are registered
-    operations = []
-    for line in content.split('\n'):
-        if '*setopname' in line:
-            parts = line.split()
-            if len(parts) >= 3:
-                operations.append(parts[2])
+    # Operations registered with *setopname
+    operations = [op.decode() for op in _SETOPNAME_RE.findall(content)]
 
-    # Count goals (!) in testing phase
-    testing_phase = False
+    # Count goals (!) in testing phase, starting at the TESTING PHASE line
     goal_count = 0
-    for line in content.split('\n'):
-        if "TESTING PHASE" in line:
-            testing_phase = True
-        if testing_phase and "!" in line and ":|:" in line:
-            goal_count += 1
+    testing_phase = content.find(b"TESTING PHASE")
+    if testing_phase >= 0:
+        line_start = content.rfind(b'\n', 0, testing_phase) + 1
+        goal_count = len(_GOAL_RE.findall(content, line_start))
 
     return {
         "threshold": threshold,
@@ -59,72 +72,134 @@ def parse_nal_expectations(nal_file):
         "expected_executions": goal_count
     }
 
-def run_nal_test(nal_file, ona_binary):
-    """Run a NAL test file and capture executed operations"""
-    result = subprocess.run(
+def _feed_stdin(stdin, payload):
+    """Write the test input and close stdin (runs on its own thread)"""
+    try:
+        stdin.write(payload)
+        stdin.close()
+    except BrokenPipeError:
+        pass
+
+def run_nal_test(content, ona_binary, timeout=30):
+    """Run NAL file content (bytes) and capture executed operations
+
+    Output is read line by line as ONA produces it and only the executed
+    operations are kept. A watchdog kills ONA after timeout seconds.
+    Returns (executed_ops, timed_out); on a timeout executed_ops holds the
+    operations executed before ONA was killed.
+    """
+    proc = subprocess.Popen(
         [ona_binary, "shell"],
-        input=open(nal_file).read(),
-        capture_output=True,
-        text=True,
-        timeout=30
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True
     )
+    expired = threading.Event()
+
+    def expire():
+        expired.set()
+        # Kill the whole session so no child keeps stdout open
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    watchdog = threading.Timer(timeout, expire)
+    watchdog.start()
+    # Feed stdin concurrently so a large test cannot deadlock against a
+    # full stdout pipe
+    feeder = threading.Thread(target=_feed_stdin,
+                              args=(proc.stdin, content))
+    feeder.start()
 
     # Parse output for executed operations
     executed_ops = []
-    for line in result.stdout.split('\n'):
-        if line.startswith('^executed:'):
-            parts = line.split()
-            if len(parts) >= 2:
-                op = parts[1]
-                executed_ops.append(op)
+    try:
+        with proc.stdout:
+            for line in proc.stdout:
+                m = _EXEC_RE.match(line)
+                if m:
+                    executed_ops.append(m.group(1).decode())
+        proc.wait()
+    finally:
+        watchdog.cancel()
+        feeder.join()
+
+    return executed_ops, expired.is_set()
+
+def run_test_file(nal_file, ona_binary, out=None):
+    """Run a single test file and return results
+
+    The report is printed to out (default: sys.stdout).
+    """
+    if out is None:
+        out = sys.stdout
+    nal_path = Path(nal_file)
+    name = nal_path.name
 
-    return executed_ops
+    print(f"\n{'='*70}", file=out)
+    print(f"Running: {name}", file=out)
+    print(f"{'='*70}", file=out)
 
-def run_test_file(nal_file, ona_binary):
-    """Run a single test file and return results"""
-    print(f"\n{'='*70}")
-    print(f"Running: {Path(nal_file).name}")
-    print(f"{'='*70}")
+    # Read the test once; it is both parsed and sent to ONA
+    content = nal_path.read_bytes()
 
     # Parse expectations
-    expectations = parse_nal_expectations(nal_file)
-    print(f"Expected operations: {expectations['operations']}")
-    print(f"Expected executions: {expectations['expected_executions']}")
-    print(f"Success threshold: {expectations['threshold']*100}%")
+    expectations = parse_nal_expectations(content)
+    print(f"Expected operations: {expectations['operations']}", file=out)
+    print(f"Expected executions: {expectations['expected_executions']}", file=out)
+    print(f"Success threshold: {expectations['threshold']*100}%", file=out)
 
     # Run test
     try:
-        executed_ops = run_nal_test(nal_file, ona_binary)
-        print(f"\nExecuted operations: {executed_ops}")
+        executed_ops, timed_out = run_nal_test(content, ona_binary)
+        print(f"\nExecuted operations: {executed_ops}", file=out)
+
+        if timed_out:
+            print("❌ TIMEOUT", file=out)
+            return TestResult(name, expectations, executed_ops, 0.0)
+
+        # Count executions of operations the test registered (all
+        # executions if it registered none)
+        op_set = frozenset(expectations['operations'])
+        if op_set:
+            hits = sum(1 for op in executed_ops if op in op_set)
+        else:
+            hits = len(executed_ops)
 
         # Calculate success rate
         if expectations['expected_executions'] > 0:
-            success_rate = len(executed_ops) / expectations['expected_executions']
+            success_rate = hits / expectations['expected_executions']
         else:
             success_rate = 1.0 if not executed_ops else 0.0
 
-        print(f"Success rate: {success_rate*100:.1f}%")
+        print(f"Success rate: {success_rate*100:.1f}%", file=out)
 
         # Determine pass/fail
         passed = success_rate >= expectations['threshold']
         if passed:
-            print(f"✅ PASSED")
+            print(f"✅ PASSED", file=out)
         else:
-            print(f"❌ FAILED (needed {expectations['threshold']*100}%)")
+            print(f"❌ FAILED (needed {expectations['threshold']*100}%)", file=out)
 
         return TestResult(
-            Path(nal_file).name,
+            name,
             expectations,
             executed_ops,
-            success_rate
+            success_rate,
+            hits
         )
 
-    except subprocess.TimeoutExpired:
-        print("❌ TIMEOUT")
-        return TestResult(Path(nal_file).name, expectations, [], 0.0)
     except Exception as e:
-        print(f"❌ ERROR: {e}")
-        return TestResult(Path(nal_file).name, expectations, [], 0.0)
+        print(f"❌ ERROR: {e}", file=out)
+        return TestResult(name, expectations, [], 0.0)
+
+def run_test_file_buffered(nal_file, ona_binary):
+    """Run a single test file, returning (result, report) with the report as text"""
+    out = io.StringIO()
+    result = run_test_file(nal_file, ona_binary, out)
+    return result, out.getvalue()
 
 def main():
     # Find ONA binary
@@ -147,27 +222,32 @@ def main():
 
     print(f"Found {len(test_files)} test file(s)")
 
-    # Run all tests
+    # Run all tests. Each test is an independent ONA process, so they run
+    # concurrently; every report is buffered and printed whole, in test order.
     results = []
-    for test_file in test_files:
-        result = run_test_file(test_file, ona_binary)
-        results.append(result)
+    workers = min(len(test_files), os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        runs = pool.map(run_test_file_buffered, test_files,
+                        [str(ona_binary)] * len(test_files))
+        for result, report in runs:
+            sys.stdout.write(report)
+            sys.stdout.flush()
+            results.append(result)
 
-    # Print summary
-    print(f"\n{'='*70}")
-    print("SUMMARY")
-    print(f"{'='*70}")
+    # Print summary, assembled first and written at once
+    lines = [f"\n{'='*70}", "SUMMARY", f"{'='*70}"]
 
     for result in results:
         status = "✅ PASS" if result.passed else "❌ FAIL"
-        print(f"{status} {result.name:30s} {result.success_rate*100:5.1f}% "
-              f"({len(result.found_ops)}/{result.expected_ops['expected_executions']})")
+        lines.append(f"{status} {result.name:30s} {result.success_rate*100:5.1f}% "
+                     f"({result.hits}/{result.expected_ops['expected_executions']})")
 
     # Overall result
     passed_count = sum(1 for r in results if r.passed)
-    print(f"\n{'='*70}")
-    print(f"Passed: {passed_count}/{len(results)}")
-    print(f"{'='*70}")
+    lines.append(f"\n{'='*70}")
+    lines.append(f"Passed: {passed_count}/{len(results)}")
+    lines.append(f"{'='*70}")
+    sys.stdout.write('\n'.join(lines) + '\n')
 
     # Exit with appropriate code
     sys.exit(0 if passed_count == len(results) else 1)